@@ -0,0 +1,129 @@
+import time
+import threading
+
+from collections import deque
+
+from http import HTTPStatus
+
+from flask import Flask, current_app, g, request
+
+
+class Waiter:
+
+    def __init__(self):
+        self.granted = False
+
+
+class Gate:
+
+    def __init__(self, max_concurrent: int, max_queued: int, timeout: float, retry_after: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self.condition = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        # Queued requests in arrival order, release hands its slot to the oldest one
+        self.waiters = deque()
+        self.max_queued_seen = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def acquire(self) -> bool:
+        with self.condition:
+            if self.active < self.max_concurrent and not self.waiters:
+                self.active += 1
+                self.admitted += 1
+                return True
+
+            if self.queued >= self.max_queued:
+                self.shed += 1
+                return False
+
+            waiter = Waiter()
+            self.waiters.append(waiter)
+            self.queued += 1
+            self.max_queued_seen = max(self.max_queued_seen, self.queued)
+            deadline = time.monotonic() + self.timeout
+
+            try:
+                while not waiter.granted:
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        self.waiters.remove(waiter)
+                        self.shed += 1
+                        return False
+
+                    self.condition.wait(remaining)
+
+                # The slot is still counted as active, it was handed over by release
+                self.admitted += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    def release(self) -> None:
+        with self.condition:
+            # Hand the slot directly to the oldest queued request rather than freeing it,
+            # otherwise a new arrival could take it ahead of the queue
+            if self.waiters:
+                self.waiters.popleft().granted = True
+                self.condition.notify_all()
+            else:
+                self.active -= 1
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued,
+                'active': self.active,
+                'queued': self.queued,
+                'max_queued_seen': self.max_queued_seen,
+                'admitted': self.admitted,
+                'shed': self.shed
+            }
+
+
+class AdmissionControl:
+
+    def __init__(self):
+        self.gates = {}
+
+    def init_app(self, app: Flask) -> None:
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    def limit(self, resource, methods: list, max_concurrent: int, max_queued: int, timeout: float, retry_after: int=1) -> None:
+        # Flask-RESTful names the endpoint of a resource after its lowercased class name
+        endpoint = resource.__name__.lower()
+
+        for method in methods:
+            self.gates[(endpoint, method.upper())] = Gate(max_concurrent=max_concurrent,
+                                                          max_queued=max_queued,
+                                                          timeout=timeout,
+                                                          retry_after=retry_after)
+
+    def before_request(self):
+        gate = self.gates.get((request.endpoint, request.method))
+
+        if not gate:
+            return None
+
+        if not gate.acquire():
+            current_app.logger.warning('Shed {} {}: {} active, {} queued'.format(request.method, request.path, gate.active, gate.queued))
+            return {'msg': 'Service Unavailable'}, HTTPStatus.SERVICE_UNAVAILABLE, {'Retry-After': str(gate.retry_after)}
+
+        g.admission_gate = gate
+
+    def teardown_request(self, exc) -> None:
+        gate = g.pop('admission_gate', None)
+
+        if gate:
+            gate.release()
+
+    def get_stats(self) -> dict:
+        return {'{} {}'.format(method, endpoint): gate.get_stats() for (endpoint, method), gate in self.gates.items()}
@@ -1,24 +1,36 @@
 import os
 
+import click
+
 from flask import Flask, request
 from flask_migrate import Migrate
 from flask_restful import Api
+from flask_jwt_extended import view_decorators
 from flask_uploads import configure_uploads, patch_request_class
 
 from dotenv import load_dotenv
 
-from extensions import db, jwt, image_set, cache, limiter
+from extensions import db, jwt, claims_cache, image_set, cache, limiter, admission
 
 from resources.user import (
     UserListResource, 
     UserResource, 
+    UserBatchResource,
     MeResource, 
     UserActivateResource, 
     UserAvatarUploadResource, 
+    AvatarResource,
     UserFriendsListResource,
-    UserFriendsResource
+    UserFriendsResource,
+    UserMutualFriendsResource,
+    UserFriendSuggestionsResource
 )
 from resources.token import TokenResource, RefreshToken, RevokeResource, blacklist
+from resources.metrics import AdmissionMetricsResource
+from resources.export import ExportResource
+
+from avatars import sweep_avatars
+from exports import EXPORT_COLUMNS, EXPORT_FORMATS, generate_export
 
 from utils import get_logger
 
@@ -34,6 +46,8 @@ def create_app() -> Flask:
         conf_str = 'config.ProductionConfig'
     elif env == 'Staging':
         conf_str = 'config.StagingConfig'
+    elif env == 'Testing':
+        conf_str = 'config.TestingConfig'
     else:
         conf_str = 'config.DevelopmentConfig'
 
@@ -46,6 +60,7 @@ def create_app() -> Flask:
     
     register_extensions(app)
     register_resources(app)
+    register_commands(app)
 
     logger.debug('Application instance created')
     
@@ -55,10 +70,14 @@ def register_extensions(app: Flask) -> None:
     db.init_app(app)
     Migrate(app, db)
     jwt.init_app(app)
+    claims_cache.maxsize = app.config.get('JWT_CLAIMS_CACHE_SIZE')
+    # Skip re-verifying the signature of tokens already seen by this worker
+    view_decorators.decode_token = claims_cache.wrap(view_decorators.decode_token)
     configure_uploads(app, image_set)
     patch_request_class(app, 10 * 1024 * 1024)
     cache.init_app(app)
     limiter.init_app(app)
+    admission.init_app(app)
 
     @jwt.token_in_blacklist_loader
     def check_if_token_in_blacklist(decrypted_token: dict) -> bool:
@@ -68,18 +87,52 @@ def register_extensions(app: Flask) -> None:
 def register_resources(app: Flask) -> None:
     api = Api(app)
 
+    # Bound the number of threads CPU heavy endpoints (password hashing, image processing) can hold
+    admission.limit(TokenResource, methods=['POST'], max_concurrent=4, max_queued=8, timeout=2)
+    admission.limit(UserListResource, methods=['POST'], max_concurrent=4, max_queued=8, timeout=2)
+    admission.limit(UserAvatarUploadResource, methods=['PUT'], max_concurrent=2, max_queued=4, timeout=5, retry_after=5)
+
     api.add_resource(UserListResource, '/users')
     api.add_resource(UserResource, '/users/<string:username>')
+    api.add_resource(UserBatchResource, '/users/batch')
     api.add_resource(MeResource, '/me')
     api.add_resource(UserActivateResource, '/users/activate/<string:token>')
     api.add_resource(UserAvatarUploadResource, '/users/avatar')
+    api.add_resource(AvatarResource, '/avatars/<string:filename>')
     api.add_resource(UserFriendsListResource, '/users/friends')
     api.add_resource(UserFriendsResource, '/users/friends/<string:username>')
+    api.add_resource(UserFriendSuggestionsResource, '/users/friends/suggestions')
+    api.add_resource(UserMutualFriendsResource, '/users/<string:username>/mutual')
     
     api.add_resource(TokenResource, '/token')
     api.add_resource(RefreshToken, '/refresh')
     api.add_resource(RevokeResource, '/revoke')
 
+    api.add_resource(AdmissionMetricsResource, '/metrics/admission')
+    api.add_resource(ExportResource, '/admin/export/<string:table>')
+
+def register_commands(app: Flask) -> None:
+    @app.cli.command('export')
+    @click.argument('table', type=click.Choice(list(EXPORT_COLUMNS)))
+    @click.option('--format', 'format', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson')
+    @click.option('--gzip', is_flag=True, help='Compress the output with gzip.')
+    @click.option('--output', type=click.File('wb'), default='-', help='Output file, defaults to stdout.')
+    def export(table: str, format: str, gzip: bool, output) -> None:
+        """Stream a table as NDJSON or CSV."""
+        for chunk in generate_export(table=table, format=format, compress=gzip):
+            output.write(chunk)
+
+    @app.cli.command('sweep-avatars')
+    @click.option('--grace', type=int, default=None, help='Keep files modified less than this many seconds ago.')
+    def sweep(grace: int) -> None:
+        """Delete avatar files no user references anymore."""
+        if grace is None:
+            grace = app.config.get('AVATAR_SWEEP_GRACE')
+
+        removed = sweep_avatars(grace=grace)
+
+        click.echo('Removed {} unreferenced avatar(s).'.format(len(removed)))
+
 @limiter.request_filter
 def ip_whitelist():
     return request.remote_addr == '127.0.0.1'
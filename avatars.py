@@ -0,0 +1,36 @@
+import os
+import time
+
+from extensions import image_set
+
+from models.user import User
+
+
+def sweep_avatars(grace: int) -> list:
+    directory = image_set.path(filename='', folder='avatars')
+    cutoff = time.time() - grace
+
+    candidates = [entry.name for entry in os.scandir(directory)
+                  if entry.is_file() and entry.name.endswith('.jpg') and entry.stat().st_mtime < cutoff]
+
+    referenced = User.get_avatar_images()
+    removed = []
+
+    for filename in candidates:
+        if filename in referenced:
+            continue
+
+        path = os.path.join(directory, filename)
+
+        # An upload reusing the file refreshes its modification time before saving the user,
+        # check both again right before removing it
+        try:
+            if os.stat(path).st_mtime >= cutoff or User.count_by_avatar_image(filename):
+                continue
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+
+        removed.append(filename)
+
+    return removed
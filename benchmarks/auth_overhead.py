@@ -0,0 +1,39 @@
+import sys
+import pathlib
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from flask_jwt_extended import create_access_token, verify_jwt_in_request
+
+from app import create_app
+from extensions import claims_cache
+
+
+def measure(app, token: str, cache_size: int, number: int) -> float:
+    claims_cache.clear()
+    claims_cache.maxsize = cache_size
+
+    headers = {'Authorization': 'Bearer {}'.format(token)}
+
+    with app.test_request_context('/me', headers=headers):
+        verify_jwt_in_request()
+        seconds = timeit.timeit(verify_jwt_in_request, number=number)
+
+    return seconds / number * 1e6
+
+def run(number: int=20000) -> None:
+    app = create_app()
+
+    with app.app_context():
+        token = create_access_token(identity=1, fresh=True)
+
+    before = measure(app, token, cache_size=0, number=number)
+    after = measure(app, token, cache_size=app.config.get('JWT_CLAIMS_CACHE_SIZE'), number=number)
+
+    print('Auth overhead per request without claims cache: {:.1f} us'.format(before))
+    print('Auth overhead per request with claims cache: {:.1f} us'.format(after))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,61 @@
+import sys
+import pathlib
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from app import create_app
+from resources import user as user_resources
+from utils import generate_token
+
+
+class NoMailApi:
+    def send_email(self, **kwargs):
+        return None
+
+
+def burst(app, requests: list, threads: int) -> tuple:
+    def send(args):
+        method, url, json = args
+        with app.test_client() as client:
+            return client.open(url, method=method, json=json).status_code
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        status_codes = list(executor.map(send, requests))
+
+    return time.perf_counter() - start, status_codes
+
+def report(name: str, seconds: float, status_codes: list) -> None:
+    counts = {code: status_codes.count(code) for code in sorted(set(status_codes))}
+    print('{}: {} requests in {:.2f}s ({:.0f} req/s), status codes: {}'.format(
+        name, len(status_codes), seconds, len(status_codes) / seconds, counts))
+
+def run(count: int=10000, signup_threads: int=4, activation_threads: int=16) -> None:
+    app = create_app()
+    # Do not send real emails during the benchmark
+    user_resources.mailgun = NoMailApi()
+
+    run_id = uuid.uuid4().hex[:8]
+    users = [{'username': 'bench-{}-{}'.format(run_id, i),
+              'email': 'bench-{}-{}@example.com'.format(run_id, i),
+              'password': 'password'} for i in range(count)]
+
+    # Signups are bounded by the admission control of POST /users, stay within it
+    seconds, status_codes = burst(app, [('POST', '/users', user) for user in users], signup_threads)
+    report('Signups', seconds, status_codes)
+
+    with app.test_request_context():
+        urls = ['/users/activate/{}'.format(generate_token(user['email'], salt='activate')) for user in users]
+
+    seconds, status_codes = burst(app, [('GET', url, None) for url in urls], activation_threads)
+    report('Activations', seconds, status_codes)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    run(count=count)
@@ -14,18 +14,40 @@ class Config:
 
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
+    JWT_CLAIMS_CACHE_SIZE = 10000
 
     UPLOADED_IMAGES_DEST = 'static/images'
 
-    CACHE_TYPE = 'simple'
+    # Let the front proxy stream avatars: either Flask's X-Sendfile (Apache, lighttpd)
+    # or an nginx internal location prefix used for X-Accel-Redirect
+    USE_X_SENDFILE = False
+    AVATAR_ACCEL_REDIRECT_PREFIX = None
+    AVATAR_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+    # Unreferenced avatars younger than this are kept, an upload may be about to use them
+    AVATAR_SWEEP_GRACE = 60 * 60
+
+    CACHE_TYPE = 'twotiercache.two_tier'
     CACHE_DEFAULT_TIMEOUT = 600
+    CACHE_KEY_PREFIX = 'api/'
+    CACHE_LOCAL_SIZE = 1000
+    CACHE_LOCAL_TIMEOUT = 5
+    CACHE_SHARED_BACKEND = 'sqlite'
+    # How long an expired response is still served while a single request recomputes it
+    CACHE_STALE_TIMEOUT = 30
+    CACHE_LOCK_TIMEOUT = 10
 
     RATELIMIT_HEADERS_ENABLED = True
 
+    METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+    FRIEND_GRAPH_MAX_AGE = 300
+    FRIENDS_SYNC_OVERLAP = 5
+
     ROOT = pathlib.Path(__file__).resolve().parent
     LOG_DIR = ROOT / 'logs'
     LOG_DIR.mkdir(exist_ok=True)
     LOG_FILE = LOG_DIR / 'api.log'
+    CACHE_SQLITE_PATH = ROOT / 'cache.sqlite'
     FORMATTER = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s')
 
 
@@ -40,13 +62,27 @@ class DevelopmentConfig(Config):
     SECRET_KEY = 'secret-key'
 
 
+class TestingConfig(Config):
+    TESTING = True
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL')
+
+    SECRET_KEY = 'secret-key'
+
+
 class StagingConfig(Config):
     SECRET_KEY = os.environ.get('SECRET_KEY')
 
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
 
+    CACHE_SHARED_BACKEND = 'redis'
+    CACHE_REDIS_URL = os.environ.get('REDIS_URL')
+
 
 class ProductionConfig(Config):
     SECRET_KEY = os.environ.get('SECRET_KEY')
 
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+
+    CACHE_SHARED_BACKEND = 'redis'
+    CACHE_REDIS_URL = os.environ.get('REDIS_URL')
@@ -0,0 +1,82 @@
+import io
+import csv
+import json
+import zlib
+
+from models.user import User, Friendship
+
+
+EXPORT_COLUMNS = {
+    'users': (User.id, User.username, User.email, User.is_active, User.avatar_image, User.created_at, User.updated_at, User.deleted_at),
+    'friendships': (Friendship.user_id_1, Friendship.user_id_2, Friendship.created_at, Friendship.updated_at, Friendship.removed_at)
+}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+BATCH_SIZE = 1000
+
+
+def get_export_rows(table: str):
+    columns = EXPORT_COLUMNS[table]
+    # yield_per streams rows from a server-side cursor instead of loading the whole table
+    query = columns[0].class_.query.with_entities(*columns).order_by(*columns[:2]).yield_per(BATCH_SIZE)
+
+    return [column.key for column in columns], query
+
+def serialize_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def generate_ndjson(names: list, rows):
+    lines = []
+
+    for row in rows:
+        lines.append(json.dumps({name: serialize_value(value) for name, value in zip(names, row)}))
+
+        if len(lines) >= BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def generate_csv(names: list, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([serialize_value(value) for value in row])
+
+        if i % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+def generate_export(table: str, format: str, compress: bool=False):
+    names, rows = get_export_rows(table)
+
+    if format == 'csv':
+        chunks = generate_csv(names, rows)
+    else:
+        chunks = generate_ndjson(names, rows)
+
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode()
+        return
+
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+
+    yield compressor.flush()
@@ -5,9 +5,16 @@ from flask_caching import Cache
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+from admission import AdmissionControl
+from friendgraph import FriendGraph
+from tokencache import ClaimsCache
+
 
 db = SQLAlchemy()
 jwt = JWTManager()
+claims_cache = ClaimsCache()
 image_set = UploadSet('images', IMAGES)
 cache = Cache()
 limiter = Limiter(key_func=get_remote_address)
+admission = AdmissionControl()
+friend_graph = FriendGraph()
@@ -0,0 +1,157 @@
+import time
+import threading
+
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+
+class FriendGraph:
+
+    COMPACT_THRESHOLD = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()
+        self.loaded_at = None
+        # Mutations applied while a rebuild reads its snapshot, replayed on top of it
+        self.journal = None
+        self.clear()
+
+    def clear(self):
+        # Compressed sparse rows: neighbors of ids[i] are neighbors[offsets[i]:offsets[i + 1]]
+        self.ids = array('q')
+        self.offsets = array('q', [0])
+        self.neighbors = array('q')
+
+        # Mutations applied since the last (re)build
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+        self.pending = 0
+
+    def is_stale(self, max_age: int) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > max_age
+
+    def refresh(self, max_age: int, get_edges) -> None:
+        if not self.is_stale(max_age):
+            return
+
+        # A single thread rebuilds, the others keep reading the current index unless there is none yet
+        if not self.rebuild_lock.acquire(blocking=self.loaded_at is None):
+            return
+
+        try:
+            if self.is_stale(max_age):
+                self.rebuild(get_edges())
+        finally:
+            self.rebuild_lock.release()
+
+    def rebuild(self, edges) -> None:
+        # Start recording before the edges are read, so that any mutation committed after
+        # the snapshot is taken also ends up in the journal
+        with self.lock:
+            self.journal = []
+
+        try:
+            adjacency = defaultdict(set)
+
+            for user_id_1, user_id_2 in edges:
+                adjacency[user_id_1].add(user_id_2)
+                adjacency[user_id_2].add(user_id_1)
+
+            with self.lock:
+                journal = self.journal
+                self.journal = None
+                self._build(adjacency)
+
+                for user_id_1, user_id_2, add in journal:
+                    self._apply(user_id_1, user_id_2, add=add)
+
+                self.loaded_at = time.monotonic()
+        finally:
+            with self.lock:
+                self.journal = None
+
+    def _build(self, adjacency: dict) -> None:
+        self.clear()
+
+        for user_id in sorted(adjacency):
+            if not adjacency[user_id]:
+                continue
+            self.ids.append(user_id)
+            self.neighbors.extend(sorted(adjacency[user_id]))
+            self.offsets.append(len(self.neighbors))
+
+    def _row(self, user_id: int):
+        i = bisect_left(self.ids, user_id)
+
+        if i == len(self.ids) or self.ids[i] != user_id:
+            return ()
+
+        return self.neighbors[self.offsets[i]:self.offsets[i + 1]]
+
+    def _friends(self, user_id: int) -> set:
+        friends = set(self._row(user_id))
+
+        if user_id in self.added:
+            friends |= self.added[user_id]
+
+        if user_id in self.removed:
+            friends -= self.removed[user_id]
+
+        return friends
+
+    def _compact(self) -> None:
+        user_ids = set(self.ids) | set(self.added)
+        self._build({user_id: self._friends(user_id) for user_id in user_ids})
+
+    def _apply(self, user_id_1: int, user_id_2: int, add: bool) -> None:
+        if self.journal is not None:
+            self.journal.append((user_id_1, user_id_2, add))
+
+        for a, b in ((user_id_1, user_id_2), (user_id_2, user_id_1)):
+            if add:
+                self.removed[a].discard(b)
+                self.added[a].add(b)
+            else:
+                self.added[a].discard(b)
+                self.removed[a].add(b)
+
+        self.pending += 1
+
+        if self.pending > self.COMPACT_THRESHOLD:
+            self._compact()
+
+    def add_edge(self, user_id_1: int, user_id_2: int) -> None:
+        with self.lock:
+            self._apply(user_id_1, user_id_2, add=True)
+
+    def remove_edge(self, user_id_1: int, user_id_2: int) -> None:
+        with self.lock:
+            self._apply(user_id_1, user_id_2, add=False)
+
+    def remove_user(self, user_id: int) -> None:
+        with self.lock:
+            for friend_id in self._friends(user_id):
+                self._apply(user_id, friend_id, add=False)
+
+    def friends(self, user_id: int) -> set:
+        with self.lock:
+            return self._friends(user_id)
+
+    def mutual(self, user_id_1: int, user_id_2: int) -> list:
+        with self.lock:
+            return sorted(self._friends(user_id_1) & self._friends(user_id_2))
+
+    def suggestions(self, user_id: int, limit: int) -> list:
+        with self.lock:
+            friends = self._friends(user_id)
+            counts = Counter()
+
+            for friend_id in friends:
+                counts.update(self._friends(friend_id))
+
+        for excluded in friends | {user_id}:
+            counts.pop(excluded, None)
+
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
@@ -0,0 +1,77 @@
+import time
+import threading
+
+
+class Waiter:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lead = False
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class GroupCommit:
+
+    def __init__(self, flush, max_batch: int=500, max_delay: float=0.002):
+        # flush receives a list of items and returns a dict mapping each item to its result
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self.lock = threading.Lock()
+        self.pending = []
+        self.flushing = False
+
+    def submit(self, item):
+        waiter = Waiter()
+
+        with self.lock:
+            self.pending.append((item, waiter))
+
+            if not self.flushing:
+                self.flushing = True
+                waiter.lead = True
+
+        # The leading request waits a little for others to join, then writes the whole batch at once
+        while not waiter.done:
+            if waiter.lead:
+                waiter.lead = False
+                time.sleep(self.max_delay)
+                self._flush_batch()
+            else:
+                waiter.event.wait()
+                waiter.event.clear()
+
+        if waiter.error:
+            raise waiter.error
+
+        return waiter.result
+
+    def _flush_batch(self) -> None:
+        with self.lock:
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+
+        try:
+            results = self.flush([item for item, _ in batch])
+            error = None
+        except Exception as err:
+            results = {}
+            error = err
+
+        for item, waiter in batch:
+            waiter.result = results.get(item)
+            waiter.error = error
+            waiter.done = True
+            waiter.event.set()
+
+        with self.lock:
+            # Hand over to the oldest request still waiting, if any
+            if self.pending:
+                next_waiter = self.pending[0][1]
+                next_waiter.lead = True
+                next_waiter.event.set()
+            else:
+                self.flushing = False
@@ -0,0 +1,44 @@
+"""create user and friendship tables
+
+Revision ID: 3f2a1c9d7b10
+Revises: 
+Create Date: 2026-10-19 04:15:02.118304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a1c9d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('email', sa.String(length=200), nullable=False),
+    sa.Column('password', sa.String(length=200), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('avatar_image', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('friendship',
+    sa.Column('user_id_1', sa.Integer(), nullable=False),
+    sa.Column('user_id_2', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id_1'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_id_2'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id_1', 'user_id_2')
+    )
+
+
+def downgrade():
+    op.drop_table('friendship')
+    op.drop_table('user')
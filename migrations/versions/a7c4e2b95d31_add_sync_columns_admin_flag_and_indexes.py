@@ -0,0 +1,64 @@
+"""add friendship sync columns, admin flag and hot path indexes
+
+Revision ID: a7c4e2b95d31
+Revises: 3f2a1c9d7b10
+Create Date: 2026-10-19 04:16:40.552910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c4e2b95d31'
+down_revision = '3f2a1c9d7b10'
+branch_labels = None
+depends_on = None
+
+
+def check_case_duplicate_emails():
+    # The unique index on lower(email) cannot be built while several users share an email
+    # that only differs by case, and picking which account to keep is not a migration's call
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT lower(email), count(*) FROM "user" GROUP BY lower(email) HAVING count(*) > 1 ORDER BY 1 LIMIT 20'
+    )).fetchall()
+
+    if duplicates:
+        raise RuntimeError('Cannot create ix_user_lower_email, these emails belong to several users '
+                           'with a different case: {}. Merge or rename these accounts, then run the '
+                           'upgrade again.'.format(', '.join('{} ({} users)'.format(email, count) for email, count in duplicates)))
+
+
+def upgrade():
+    op.add_column('user', sa.Column('is_admin', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+    op.add_column('friendship', sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.add_column('friendship', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.add_column('friendship', sa.Column('removed_at', sa.DateTime(), nullable=True))
+
+    op.create_index('ix_user_created_at_id', 'user', ['created_at', 'id'], unique=False)
+    op.create_index('ix_user_updated_at_id', 'user', ['updated_at', 'id'], unique=False)
+    op.create_index('ix_user_avatar_image', 'user', ['avatar_image'], unique=False)
+
+    # Autogenerate skips expression indexes, this one has to stay written by hand
+    check_case_duplicate_emails()
+    op.create_index('ix_user_lower_email', 'user', [sa.text('lower(email)')], unique=True)
+
+    op.create_index('ix_friendship_user_id_2', 'friendship', ['user_id_2'], unique=False)
+    op.create_index('ix_friendship_user_id_1_updated_at', 'friendship', ['user_id_1', 'updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_friendship_user_id_1_updated_at', table_name='friendship')
+    op.drop_index('ix_friendship_user_id_2', table_name='friendship')
+
+    op.drop_index('ix_user_lower_email', table_name='user')
+    op.drop_index('ix_user_avatar_image', table_name='user')
+    op.drop_index('ix_user_updated_at_id', table_name='user')
+    op.drop_index('ix_user_created_at_id', table_name='user')
+
+    op.drop_column('friendship', 'removed_at')
+    op.drop_column('friendship', 'updated_at')
+    op.drop_column('friendship', 'created_at')
+
+    op.drop_column('user', 'is_admin')
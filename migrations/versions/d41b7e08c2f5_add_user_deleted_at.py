@@ -0,0 +1,24 @@
+"""add user deleted_at
+
+Revision ID: d41b7e08c2f5
+Revises: a7c4e2b95d31
+Create Date: 2026-10-19 05:02:11.734519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41b7e08c2f5'
+down_revision = 'a7c4e2b95d31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('user', 'deleted_at')
@@ -1,72 +1,248 @@
-from sqlalchemy import asc, desc, or_
+import uuid
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, asc, desc, or_
 
 from extensions import db
 
 
+SYNC_TOKEN_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
 class Friendship(db.Model):
     __tablename__ = 'friendship'
+    __table_args__ = (
+        db.Index('ix_friendship_user_id_2', 'user_id_2'),
+        db.Index('ix_friendship_user_id_1_updated_at', 'user_id_1', 'updated_at'),
+    )
 
     user_id_1 = db.Column(db.Integer(), db.ForeignKey('user.id'), primary_key=True)
     user_id_2 = db.Column(db.Integer(), db.ForeignKey('user.id'), primary_key=True)
 
+    created_at = db.Column(db.DateTime(), nullable=False, server_default=db.func.now())
+    updated_at = db.Column(db.DateTime(), nullable=False, server_default=db.func.now(), onupdate=db.func.now())
+    # Removed friendships are kept as tombstones so clients can sync deletions
+    removed_at = db.Column(db.DateTime(), default=None)
+
+    @classmethod
+    def get_query(cls, user_id_1: int, user_id_2: int):
+        return cls.query.filter_by(user_id_1=user_id_1, user_id_2=user_id_2)
+
+    @classmethod
+    def get(cls, user_id_1: int, user_id_2: int):
+        return cls.get_query(user_id_1, user_id_2).first()
+
+    @classmethod
+    def get_all_edges(cls):
+        return db.session.query(cls.user_id_1, cls.user_id_2).filter(cls.removed_at.is_(None)).yield_per(10000)
+
+    @classmethod
+    def get_changes_query(cls, user_id: int, since):
+        return db.session.query(cls.user_id_2, cls.removed_at).filter(cls.user_id_1 == user_id, cls.updated_at > since)
+
+    @classmethod
+    def get_changes(cls, user_id: int, since):
+        return cls.get_changes_query(user_id, since).all()
+
+    @classmethod
+    def get_sync_token(cls) -> str:
+        # Microseconds since the epoch, opaque to clients and safe to put in a URL as is
+        now = db.session.query(db.func.now()).scalar()
+        return str((now - SYNC_TOKEN_EPOCH) // timedelta(microseconds=1))
+
+    @staticmethod
+    def parse_sync_token(sync_token: str) -> datetime:
+        # 17 digits reach the year 5000, longer tokens would overflow timedelta or datetime
+        if not sync_token.isdigit() or len(sync_token) > 17:
+            raise ValueError('invalid sync token')
+
+        return SYNC_TOKEN_EPOCH + timedelta(microseconds=int(sync_token))
+
+    @classmethod
+    def add(cls, user_id_1: int, user_id_2: int) -> None:
+        for a, b in ((user_id_1, user_id_2), (user_id_2, user_id_1)):
+            friendship = cls.get(a, b)
+
+            if friendship:
+                friendship.created_at = db.func.now()
+                friendship.removed_at = None
+            else:
+                db.session.add(cls(user_id_1=a, user_id_2=b))
+
+        db.session.commit()
+
+    @classmethod
+    def remove(cls, user_id_1: int, user_id_2: int) -> None:
+        for a, b in ((user_id_1, user_id_2), (user_id_2, user_id_1)):
+            friendship = cls.get(a, b)
+
+            if friendship:
+                friendship.removed_at = db.func.now()
+
+        db.session.commit()
+
+    @classmethod
+    def get_all_by_user_query(cls, user_id: int):
+        return cls.query.filter(or_(cls.user_id_1 == user_id, cls.user_id_2 == user_id), cls.removed_at.is_(None))
+
+    @classmethod
+    def remove_all(cls, user_id: int) -> None:
+        # Tombstones every edge of the user in both directions, committed by the caller
+        cls.get_all_by_user_query(user_id).update({cls.removed_at: db.func.now()}, synchronize_session=False)
+
 
 class User(db.Model):
     __tablename__ = 'user'
+    __table_args__ = (
+        db.Index('ix_user_created_at_id', 'created_at', 'id'),
+        db.Index('ix_user_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_user_lower_email', db.text('lower(email)'), unique=True),
+        db.Index('ix_user_avatar_image', 'avatar_image'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), nullable=False, unique=True)
     email = db.Column(db.String(200), nullable=False, unique=True)
     password = db.Column(db.String(200))
     is_active = db.Column(db.Boolean(), default=False)
+    is_admin = db.Column(db.Boolean(), nullable=False, default=False, server_default=db.false())
 
     avatar_image = db.Column(db.String(100), default=None)
 
+    # Deleted users are kept, anonymized, so that the tombstones of their friendships stay valid
+    deleted_at = db.Column(db.DateTime(), default=None)
+
     friends = db.relationship('User', 
                               secondary='friendship', 
-                              primaryjoin=id==Friendship.user_id_1,
+                              primaryjoin=and_(id==Friendship.user_id_1, Friendship.removed_at.is_(None)),
                               secondaryjoin=id==Friendship.user_id_2,
-                              lazy='dynamic')
+                              lazy='dynamic',
+                              viewonly=True)
     
     created_at = db.Column(db.DateTime(), nullable=False, server_default=db.func.now())
     updated_at = db.Column(db.DateTime(), nullable=False, server_default=db.func.now(), onupdate=db.func.now())
 
+    @classmethod
+    def get_by_id_query(cls, id: int):
+        return cls.query.filter_by(id=id, deleted_at=None)
+
     @classmethod
     def get_by_id(cls, id: int):
-        return cls.query.filter_by(id=id).first()
+        return cls.get_by_id_query(id).first()
+
+    @classmethod
+    def get_by_username_query(cls, username: str):
+        return cls.query.filter_by(username=username, deleted_at=None)
 
     @classmethod
     def get_by_username(cls, username: str):
-        return cls.query.filter_by(username=username).first()
+        return cls.get_by_username_query(username).first()
+
+    @classmethod
+    def get_by_email_query(cls, email: str):
+        return cls.query.filter(db.func.lower(cls.email) == db.func.lower(email))
 
     @classmethod
     def get_by_email(cls, email: str):
-        return cls.query.filter_by(email=email).first()
+        return cls.get_by_email_query(email).first()
 
     @classmethod
-    def get_all(cls, q: str, page: int, per_page: int, sort: str, order: str):
-        keyword = '%{keyword}%'.format(keyword=q)
+    def get_by_username_or_email_query(cls, username: str, email: str):
+        # When the username and the email belong to two different users, the username match comes first
+        return cls.query.filter(or_(cls.username == username, db.func.lower(cls.email) == db.func.lower(email))) \
+            .order_by(desc(cls.username == username))
 
-        if order == 'asc':
-            sort_logic = asc(getattr(cls, sort))
-        else:
-            sort_logic = desc(getattr(cls, sort))
+    @classmethod
+    def get_by_username_or_email(cls, username: str, email: str):
+        return cls.get_by_username_or_email_query(username, email).first()
 
-        return cls.query.filter(cls.username.ilike(keyword)).order_by(sort_logic).paginate(page=page, per_page=per_page)
+    @classmethod
+    def activate_by_emails_statement(cls, emails: set):
+        return cls.__table__.update() \
+            .where(and_(db.func.lower(cls.email).in_(emails), cls.is_active.isnot(True))) \
+            .values(is_active=True) \
+            .returning(cls.email)
 
-    def get_all_friends(self, q: str, page: int, per_page: int, sort: str, order: str):
+    @classmethod
+    def activate_by_emails(cls, emails: list) -> dict:
+        emails = {email.lower() for email in emails}
+
+        try:
+            activated = {email.lower() for email, in db.session.execute(cls.activate_by_emails_statement(emails))}
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {email: email in activated for email in emails}
+
+    @classmethod
+    def count_by_avatar_image_query(cls, avatar_image: str):
+        return cls.query.filter_by(avatar_image=avatar_image)
+
+    @classmethod
+    def count_by_avatar_image(cls, avatar_image: str) -> int:
+        return cls.count_by_avatar_image_query(avatar_image).count()
+
+    @classmethod
+    def get_avatar_images(cls) -> set:
+        return {avatar_image for avatar_image, in db.session.query(cls.avatar_image).filter(cls.avatar_image.isnot(None)).distinct()}
+
+    @classmethod
+    def get_all_by_ids_query(cls, ids: list):
+        return cls.query.filter(cls.id.in_(ids), cls.deleted_at.is_(None))
+
+    @classmethod
+    def get_all_by_ids(cls, ids: list):
+        return cls.get_all_by_ids_query(ids).all()
+
+    @classmethod
+    def get_by_ids_or_usernames_query(cls, ids: list, usernames: list):
+        return cls.query.filter(or_(cls.id.in_(ids), cls.username.in_(usernames)), cls.deleted_at.is_(None))
+
+    @classmethod
+    def get_by_ids_or_usernames(cls, ids: list, usernames: list):
+        return cls.get_by_ids_or_usernames_query(ids, usernames).all()
+
+    @staticmethod
+    def get_sort_logic(sort: str, order: str) -> tuple:
+        # id breaks ties so pages are stable and the (sort, id) indexes can be scanned
+        direction = asc if order == 'asc' else desc
+        return direction(getattr(User, sort)), direction(User.id)
+
+    @classmethod
+    def get_all_query(cls, q: str, sort: str, order: str):
         keyword = '%{keyword}%'.format(keyword=q)
+        return cls.query.filter(cls.username.ilike(keyword), cls.deleted_at.is_(None)).order_by(*cls.get_sort_logic(sort, order))
 
-        if order == 'asc':
-            sort_logic = asc(getattr(User, sort))
-        else:
-            sort_logic = desc(getattr(User, sort))
-        
-        return self.friends.filter(or_(User.username.ilike(keyword), User.email.ilike(keyword))).order_by(sort_logic).paginate(page=page, per_page=per_page)
+    @classmethod
+    def get_all(cls, q: str, page: int, per_page: int, sort: str, order: str):
+        return cls.get_all_query(q, sort, order).paginate(page=page, per_page=per_page)
+
+    def get_all_friends_query(self, q: str, sort: str, order: str):
+        keyword = '%{keyword}%'.format(keyword=q)
+        return self.friends.filter(or_(User.username.ilike(keyword), User.email.ilike(keyword))).order_by(*User.get_sort_logic(sort, order))
+
+    def get_all_friends(self, q: str, page: int, per_page: int, sort: str, order: str):
+        return self.get_all_friends_query(q, sort, order).paginate(page=page, per_page=per_page)
 
     def save(self):
         db.session.add(self)
         db.session.commit()
 
     def delete(self):
-        db.session.delete(self)
+        # Soft delete: friends see the user in the removed ids of their next delta sync,
+        # while the username and the email are released for new accounts
+        Friendship.remove_all(self.id)
+
+        placeholder = 'deleted-{}'.format(uuid.uuid4().hex)
+
+        self.username = placeholder
+        self.email = '{}@deleted.invalid'.format(placeholder)
+        self.password = None
+        self.avatar_image = None
+        self.is_active = False
+        self.deleted_at = db.func.now()
+
         db.session.commit()
@@ -0,0 +1,42 @@
+from http import HTTPStatus
+
+from flask import Response, stream_with_context
+from flask_restful import Resource
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from webargs import fields
+from webargs.flaskparser import use_kwargs
+
+from models.user import User
+
+from exports import EXPORT_COLUMNS, EXPORT_FORMATS, generate_export
+
+
+class ExportResource(Resource):
+    @jwt_required
+    @use_kwargs({'format': fields.Str(missing='ndjson'),
+                 'gzip': fields.Bool(missing=False)}, location='query')
+    def get(self, table: str, format: str, gzip: bool):
+        user = User.get_by_id(id=get_jwt_identity())
+
+        if not user:
+            return {'msg': 'user not found'}, HTTPStatus.NOT_FOUND
+
+        if not user.is_admin:
+            return {'msg': 'admin rights required'}, HTTPStatus.FORBIDDEN
+
+        if table not in EXPORT_COLUMNS:
+            return {'msg': 'unknown table'}, HTTPStatus.NOT_FOUND
+
+        if format not in EXPORT_FORMATS:
+            return {'msg': 'format must be one of: {}'.format(', '.join(EXPORT_FORMATS))}, HTTPStatus.BAD_REQUEST
+
+        filename = '{}.{}'.format(table, format)
+        headers = {'Content-Disposition': 'attachment; filename={}'.format(filename)}
+
+        if gzip:
+            headers['Content-Encoding'] = 'gzip'
+
+        return Response(stream_with_context(generate_export(table=table, format=format, compress=gzip)),
+                        mimetype=EXPORT_FORMATS[format],
+                        headers=headers)
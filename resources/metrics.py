@@ -0,0 +1,14 @@
+from http import HTTPStatus
+
+from flask import current_app, request
+from flask_restful import Resource
+
+from extensions import admission
+
+
+class AdmissionMetricsResource(Resource):
+    def get(self):
+        if request.remote_addr not in current_app.config.get('METRICS_ALLOWED_IPS'):
+            return {'msg': 'forbidden'}, HTTPStatus.FORBIDDEN
+
+        return admission.get_stats(), HTTPStatus.OK
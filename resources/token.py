@@ -11,6 +11,8 @@ from flask_jwt_extended import (
     get_raw_jwt
 )
 
+from extensions import claims_cache
+
 from utils import check_password
 
 from models.user import User
@@ -53,5 +55,6 @@ class RevokeResource(Resource):
     def post(self):
         jti = get_raw_jwt()['jti']
         blacklist.add(jti)
+        claims_cache.revoke(jti)
 
         return {'msg': 'Successfully logged out'}, HTTPStatus.OK
@@ -1,6 +1,8 @@
 import os
 
-from flask import request, url_for, render_template
+from datetime import timedelta
+
+from flask import current_app, request, url_for, render_template, safe_join, send_from_directory
 from flask_restful import Resource
 from flask_jwt_extended import jwt_required, jwt_optional, get_jwt_identity
 
@@ -8,27 +10,49 @@ from http import HTTPStatus
 
 from marshmallow import ValidationError
 
+from sqlalchemy.exc import IntegrityError
+
 from webargs import fields
 from webargs.flaskparser import use_kwargs
 
-from models.user import User
-from schemas.user import UserSchema, UserPaginationSchema, UserPublicPaginationSchema
+from models.user import User, Friendship
+from schemas.user import UserSchema, UserPublicSchema, UserPaginationSchema, UserPublicPaginationSchema
 
 from mailgun import MailgunApi
+from groupcommit import GroupCommit
 
-from extensions import image_set, cache, limiter
+from extensions import db, image_set, cache, limiter, friend_graph
 
-from utils import generate_token, verify_token, save_image, clear_cache
+from utils import generate_token, verify_token, save_image, cache_response, clear_cache, user_cache_key, clear_user_cache
 
 
 user_schema = UserSchema()
 user_public_schema = UserSchema(exclude=('email', 'friends',))
 user_avatar_schema = UserSchema(only=('avatar_url',))
+user_public_profile_schema = UserPublicSchema()
 user_pagination_schema = UserPaginationSchema()
 user_public_pagination_schema = UserPublicPaginationSchema()
 
 mailgun = MailgunApi(domain=os.environ.get('MAILGUN_DOMAIN'), api_key=os.environ.get('MAILGUN_API_KEY'))
 
+BATCH_MAX_SIZE = 100
+
+# Concurrent activations are written with a single UPDATE and commit
+activation_commit = GroupCommit(flush=User.activate_by_emails)
+
+
+def get_friend_graph():
+    friend_graph.refresh(current_app.config.get('FRIEND_GRAPH_MAX_AGE'), Friendship.get_all_edges)
+
+    return friend_graph
+
+def get_public_profiles(ids: list) -> list:
+    if not ids:
+        return []
+
+    users = {user.id: user for user in User.get_all_by_ids(ids=ids)}
+    return [user_public_profile_schema.dump(users[id]) for id in ids if id in users]
+
 
 class UserListResource(Resource):
     decorators = [limiter.limit('5 per minute', methods=['GET'], error_message='Too Many Requests')]
@@ -39,7 +63,7 @@ class UserListResource(Resource):
                  'per_page': fields.Int(missing=10), 
                  'sort': fields.Str(missing='created_at'), 
                  'order': fields.Str(missing='desc')}, location='query')
-    @cache.cached(timeout=60, query_string=True)
+    @cache_response(timeout=60, namespace='users')
     def get(self, q: str, page: int, per_page: int, sort: str, order: str):
         user = User.get_by_id(get_jwt_identity())
         
@@ -64,14 +88,20 @@ class UserListResource(Resource):
         except ValidationError as err:
             return {'msg': 'validation errors', 'errors': err.messages}, HTTPStatus.BAD_REQUEST
                 
-        if User.get_by_username(username=data.get('username')):
-            return {'msg': 'username already used'}, HTTPStatus.BAD_REQUEST
+        user = User(**data)
+
+        # Rely on the unique constraints, only look for the conflicting user when one is violated
+        try:
+            user.save()
+        except IntegrityError:
+            db.session.rollback()
+
+            existing_user = User.get_by_username_or_email(username=data.get('username'), email=data.get('email'))
+
+            if existing_user and existing_user.username == data.get('username'):
+                return {'msg': 'username already used'}, HTTPStatus.BAD_REQUEST
 
-        if User.get_by_email(email=data.get('email')):
             return {'msg': 'email already used'}, HTTPStatus.BAD_REQUEST
-        
-        user = User(**data)
-        user.save()
 
         token = generate_token(user.email, salt='activate')
         subject = 'Please confirm your registration.'
@@ -80,7 +110,7 @@ class UserListResource(Resource):
 
         mailgun.send_email(to=user.email, subject=subject, text=text, html=render_template('email/activation.html', link=link))
 
-        clear_cache('/users/')
+        clear_cache('users')
 
         return user_schema.dump(user), HTTPStatus.CREATED
 
@@ -110,12 +140,17 @@ class UserResource(Resource):
         if not user:
             return {'msg': 'user not found'}, HTTPStatus.NOT_FOUND
         
+        old_username = user.username
+
         user.username = json_data.get('username') or user.username
         user.email = json_data.get('email') or user.email
         user.password = json_data.get('password') or user.password
 
         user.save()
 
+        clear_user_cache(id=user.id, username=old_username)
+        clear_user_cache(id=user.id, username=user.username)
+
         return user_schema.dump(user), HTTPStatus.OK
 
     @jwt_required
@@ -125,11 +160,61 @@ class UserResource(Resource):
         if not user:
             return {'msg': 'user not found'}, HTTPStatus.NOT_FOUND
         
+        user_id, username = user.id, user.username
+
         user.delete()
+
+        friend_graph.remove_user(user_id)
+
+        clear_user_cache(id=user_id, username=username)
+        clear_cache('users')
         
         return {}, HTTPStatus.NO_CONTENT
 
 
+class UserBatchResource(Resource):
+    decorators = [limiter.limit('10 per minute', methods=['GET'], error_message='Too Many Requests')]
+
+    @jwt_required
+    @use_kwargs({'usernames': fields.DelimitedList(fields.Str(), missing=[]),
+                 'ids': fields.DelimitedList(fields.Int(), missing=[])}, location='query')
+    def get(self, usernames: list, ids: list):
+        if len(usernames) + len(ids) > BATCH_MAX_SIZE:
+            return {'msg': 'too many users requested, maximum is {}'.format(BATCH_MAX_SIZE)}, HTTPStatus.BAD_REQUEST
+
+        keys = [user_cache_key(id=id) for id in ids] + [user_cache_key(username=username) for username in usernames]
+        cached = dict(zip(keys, cache.get_many(*keys))) if keys else {}
+
+        missing_ids = [id for id in ids if cached[user_cache_key(id=id)] is None]
+        missing_usernames = [username for username in usernames if cached[user_cache_key(username=username)] is None]
+
+        if missing_ids or missing_usernames:
+            profiles = {}
+
+            for user in User.get_by_ids_or_usernames(ids=missing_ids, usernames=missing_usernames):
+                data = user_public_profile_schema.dump(user)
+                profiles[user_cache_key(id=user.id)] = data
+                profiles[user_cache_key(username=user.username)] = data
+
+            if profiles:
+                cache.set_many(profiles)
+                cached.update(profiles)
+
+        data = []
+        seen = set()
+
+        for key in keys:
+            profile = cached.get(key)
+
+            if profile is None or profile['id'] in seen:
+                continue
+
+            seen.add(profile['id'])
+            data.append(profile)
+
+        return {'data': data}, HTTPStatus.OK
+
+
 class MeResource(Resource):
     @jwt_required
     def get(self):
@@ -148,18 +233,13 @@ class UserActivateResource(Resource):
         if email is False:
             return {'msg': 'invalid token or token expired'}, HTTPStatus.BAD_REQUEST
 
-        user = User.get_by_email(email=email)
+        if activation_commit.submit(email.lower()):
+            return {}, HTTPStatus.NO_CONTENT
 
-        if not user:
+        if not User.get_by_email(email=email):
             return {'msg': 'user not found'}, HTTPStatus.NOT_FOUND
 
-        if user.is_active:
-            return {'msg': 'user account is already activated'}, HTTPStatus.BAD_REQUEST
-
-        user.is_active = True
-        user.save()        
-
-        return {}, HTTPStatus.NO_CONTENT
+        return {'msg': 'user account is already activated'}, HTTPStatus.BAD_REQUEST
 
 
 class UserAvatarUploadResource(Resource):
@@ -178,21 +258,46 @@ class UserAvatarUploadResource(Resource):
         if not user:
             return {'msg': 'user not found'}, HTTPStatus.NOT_FOUND
 
-        if user.avatar_image:
-            avatar_path = image_set.path(folder='avatars', filename=user.avatar_image)
-            if os.path.exists(avatar_path):
-                os.remove(avatar_path)
-
         filename = save_image(image=file, folder='avatars')
 
+        # Avatars are content addressed and may be shared, the previous file is left to `flask sweep-avatars`
         user.avatar_image = filename
         user.save()
 
-        clear_cache('/users/{}'.format(user.username))
+        clear_cache('users')
+        clear_user_cache(id=user.id, username=user.username)
 
         return user_avatar_schema.dump(user), HTTPStatus.OK
 
 
+class AvatarResource(Resource):
+    def get(self, filename: str):
+        directory = os.path.abspath(image_set.path(filename='', folder='avatars'))
+        file_path = safe_join(directory, filename)
+
+        if not os.path.isfile(file_path):
+            return {'msg': 'avatar not found'}, HTTPStatus.NOT_FOUND
+
+        accel_redirect_prefix = current_app.config.get('AVATAR_ACCEL_REDIRECT_PREFIX')
+
+        if accel_redirect_prefix:
+            response = current_app.response_class(mimetype='image/jpeg')
+            response.headers['X-Accel-Redirect'] = '{}/{}'.format(accel_redirect_prefix.rstrip('/'), filename)
+        else:
+            # Streams the file, or lets the proxy do it with X-Sendfile when USE_X_SENDFILE is set
+            response = send_from_directory(directory, filename, conditional=False, add_etags=False)
+
+        # The content hash is the ETag in both modes, the default one depends on the modification
+        # time, which save_image refreshes whenever the same image is uploaded again
+        response.set_etag(os.path.splitext(filename)[0])
+        response.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(file_path))
+
+        # The file name is derived from its content, it never changes
+        response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(current_app.config.get('AVATAR_CACHE_MAX_AGE'))
+
+        return response
+
+
 class UserFriendsListResource(Resource):
     decorators = [limiter.limit('10 per minute', methods=['GET'], error_message='Too Many Requests')]
 
@@ -201,13 +306,17 @@ class UserFriendsListResource(Resource):
                  'page': fields.Int(missing=1), 
                  'per_page': fields.Int(missing=20), 
                  'sort': fields.Str(missing='created_at'), 
-                 'order': fields.Str(missing='desc')}, location='query')
-    @cache.cached(timeout=60, query_string=True)
-    def get(self, q: str, page: int, per_page: int, sort: str, order: str):
+                 'order': fields.Str(missing='desc'),
+                 'since': fields.Str(missing=None)}, location='query')
+    @cache_response(timeout=60, per_user=True, unless=lambda: 'since' in request.args)
+    def get(self, q: str, page: int, per_page: int, sort: str, order: str, since: str):
         user = User.get_by_id(id=get_jwt_identity())
         
         if not user:
             return {'msg': 'user not found'}, HTTPStatus.NOT_FOUND
+
+        if since is not None:
+            return self.get_changes(user=user, since=since)
         
         if not sort in ['created_at', 'updated_at']:
             sort = 'created_at'
@@ -215,9 +324,37 @@ class UserFriendsListResource(Resource):
         if not order in ['asc', 'desc']:
             order = 'desc'
 
+        sync_token = Friendship.get_sync_token()
         paginated_friends = user.get_all_friends(q=q, page=page, per_page=per_page, sort=sort, order=order)
+
+        data = user_pagination_schema.dump(paginated_friends)
+        data['sync_token'] = sync_token
         
-        return user_pagination_schema.dump(paginated_friends), HTTPStatus.OK
+        return data, HTTPStatus.OK
+
+    def get_changes(self, user: User, since: str):
+        sync_token = Friendship.get_sync_token()
+
+        try:
+            since = Friendship.parse_sync_token(since)
+        except ValueError:
+            return {'msg': 'invalid sync token'}, HTTPStatus.BAD_REQUEST
+
+        # A token from the future was not issued by this server
+        if since > Friendship.parse_sync_token(sync_token):
+            return {'msg': 'invalid sync token'}, HTTPStatus.BAD_REQUEST
+
+        # Rows are stamped with their transaction start time, so look back a little
+        # to catch changes committed after the previous token was issued
+        since -= timedelta(seconds=current_app.config.get('FRIENDS_SYNC_OVERLAP'))
+
+        changes = Friendship.get_changes(user_id=user.id, since=since)
+
+        return {
+            'added': [friend_id for friend_id, removed_at in changes if removed_at is None],
+            'removed': [friend_id for friend_id, removed_at in changes if removed_at is not None],
+            'sync_token': sync_token
+        }, HTTPStatus.OK
 
 
 class UserFriendsResource(Resource):
@@ -239,11 +376,9 @@ class UserFriendsResource(Resource):
         if any(friend.id==f.id for f in user.friends):
             return {'msg': 'user is already friend with other user'}, HTTPStatus.BAD_REQUEST
         
-        user.friends.append(friend)
-        friend.friends.append(user)
-        
-        user.save()
-        friend.save()
+        Friendship.add(user.id, friend.id)
+
+        friend_graph.add_edge(user.id, friend.id)
         
         return user_schema.dump(user), HTTPStatus.OK
 
@@ -262,10 +397,50 @@ class UserFriendsResource(Resource):
         if not any(friend.id==f.id for f in user.friends):
             return {'msg': 'user is not friend with other user'}, HTTPStatus.BAD_REQUEST
         
-        user.friends.remove(friend)
-        friend.friends.remove(user)
-        
-        user.save()
-        friend.save()
+        Friendship.remove(user.id, friend.id)
+
+        friend_graph.remove_edge(user.id, friend.id)
 
         return user_schema.dump(user), HTTPStatus.OK
+
+
+class UserMutualFriendsResource(Resource):
+    @jwt_required
+    def get(self, username: str):
+        user = User.get_by_id(get_jwt_identity())
+
+        if not user:
+            return {'msg': 'user not found'}, HTTPStatus.NOT_FOUND
+
+        other = User.get_by_username(username=username)
+
+        if not other:
+            return {'msg': 'other user not found'}, HTTPStatus.NOT_FOUND
+
+        mutual_ids = get_friend_graph().mutual(user.id, other.id)
+
+        return {'data': get_public_profiles(ids=mutual_ids)}, HTTPStatus.OK
+
+
+class UserFriendSuggestionsResource(Resource):
+    decorators = [limiter.limit('10 per minute', methods=['GET'], error_message='Too Many Requests')]
+
+    @jwt_required
+    @use_kwargs({'limit': fields.Int(missing=10)}, location='query')
+    def get(self, limit: int):
+        user = User.get_by_id(get_jwt_identity())
+
+        if not user:
+            return {'msg': 'user not found'}, HTTPStatus.NOT_FOUND
+
+        limit = min(max(limit, 1), 50)
+
+        suggestions = get_friend_graph().suggestions(user.id, limit=limit)
+        mutual_counts = dict(suggestions)
+
+        data = get_public_profiles(ids=[id for id, _ in suggestions])
+
+        for profile in data:
+            profile['mutual_friends'] = mutual_counts[profile['id']]
+
+        return {'data': data}, HTTPStatus.OK
@@ -27,7 +27,7 @@ class UserSchema(Schema):
 
     def dump_avatar_url(self, user: User):
         if user.avatar_image:
-            return url_for('static', filename='images/avatars/{}'.format(user.avatar_image), _external=True)
+            return url_for('avatarresource', filename=user.avatar_image, _external=True)
         else:
             return url_for('static', filename='images/assets/default-avatar.jpg', _external=True)
 
@@ -43,7 +43,7 @@ class UserPublicSchema(Schema):
 
     def dump_avatar_url(self, user: User):
         if user.avatar_image:
-            return url_for('static', filename='images/avatars/{}'.format(user.avatar_image), _external=True)
+            return url_for('avatarresource', filename=user.avatar_image, _external=True)
         else:
             return url_for('static', filename='images/assets/default-avatar.jpg', _external=True)
 
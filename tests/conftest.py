@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+from flask_migrate import upgrade, downgrade
+
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', '')
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not TEST_DATABASE_URL.startswith('postgresql'):
+        pytest.skip('TEST_DATABASE_URL does not point to a PostgreSQL database')
+
+    os.environ['ENV'] = 'Testing'
+
+    from app import create_app
+
+    app = create_app()
+
+    # The schema is built by the migrations, so the tests also cover them
+    with app.app_context():
+        upgrade()
+        yield app
+        downgrade(revision='base')
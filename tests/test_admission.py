@@ -0,0 +1,91 @@
+import threading
+import time
+
+from admission import Gate
+
+
+def wait_until(condition, timeout: float=2) -> None:
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met in time'
+        time.sleep(0.001)
+
+
+def test_queued_request_gets_freed_slot_before_new_arrival():
+    gate = Gate(max_concurrent=1, max_queued=2, timeout=0.2, retry_after=1)
+    assert gate.acquire()
+
+    admitted = []
+    hold = threading.Event()
+
+    def queued_request():
+        admitted.append(gate.acquire())
+        hold.wait()
+        gate.release()
+
+    thread = threading.Thread(target=queued_request, daemon=True)
+    thread.start()
+
+    try:
+        wait_until(lambda: gate.queued == 1)
+
+        gate.release()
+
+        # The slot went to the queued request, even before it wakes up a new arrival has to wait and times out
+        assert not gate.acquire()
+    finally:
+        hold.set()
+        thread.join()
+
+    assert admitted == [True]
+    assert gate.get_stats()['active'] == 0
+
+
+def test_request_is_shed_after_timeout():
+    gate = Gate(max_concurrent=1, max_queued=1, timeout=0.05, retry_after=1)
+    assert gate.acquire()
+
+    start = time.monotonic()
+    assert not gate.acquire()
+    assert time.monotonic() - start >= 0.05
+
+    stats = gate.get_stats()
+    assert stats['shed'] == 1
+    assert stats['queued'] == 0
+    assert stats['active'] == 1
+
+    gate.release()
+    assert gate.acquire()
+
+
+def test_request_is_shed_when_queue_is_full():
+    gate = Gate(max_concurrent=1, max_queued=0, timeout=5, retry_after=1)
+    assert gate.acquire()
+
+    assert not gate.acquire()
+    assert gate.get_stats()['shed'] == 1
+
+
+def test_active_returns_to_zero():
+    gate = Gate(max_concurrent=2, max_queued=50, timeout=5, retry_after=1)
+
+    def request():
+        assert gate.acquire()
+        time.sleep(0.001)
+        gate.release()
+
+    threads = [threading.Thread(target=request) for _ in range(20)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    stats = gate.get_stats()
+    assert stats['active'] == 0
+    assert stats['queued'] == 0
+    assert stats['admitted'] == 20
+    assert stats['shed'] == 0
+    assert not gate.waiters
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from groupcommit import GroupCommit
+
+
+class RecordingFlush:
+
+    def __init__(self, delay: float=0, error: Exception=None):
+        self.delay = delay
+        self.error = error
+        self.lock = threading.Lock()
+        self.batches = []
+
+    def __call__(self, items: list) -> dict:
+        with self.lock:
+            self.batches.append(list(items))
+
+        time.sleep(self.delay)
+
+        if self.error:
+            raise self.error
+
+        return {item: item * 2 for item in items}
+
+
+def submit_all(group_commit: GroupCommit, items: list) -> list:
+    barrier = threading.Barrier(len(items))
+    results = {}
+    errors = {}
+
+    def submit(item):
+        barrier.wait()
+
+        try:
+            results[item] = group_commit.submit(item)
+        except Exception as err:
+            errors[item] = err
+
+    threads = [threading.Thread(target=submit, args=(item,), daemon=True) for item in items]
+
+    for thread in threads:
+        thread.start()
+
+    deadline = time.monotonic() + 5
+
+    for thread in threads:
+        thread.join(timeout=max(0, deadline - time.monotonic()))
+
+    # A lost handover leaves requests waiting forever
+    assert not any(thread.is_alive() for thread in threads), 'requests still waiting'
+
+    return [errors.get(item, results.get(item)) for item in items]
+
+
+def test_concurrent_submits_are_written_together():
+    flush = RecordingFlush(delay=0.01)
+    group_commit = GroupCommit(flush=flush, max_delay=0.01)
+
+    results = submit_all(group_commit, list(range(50)))
+
+    assert results == [item * 2 for item in range(50)]
+    assert sorted(item for batch in flush.batches for item in batch) == list(range(50))
+    assert len(flush.batches) < 50
+
+
+def test_leader_hands_over_remaining_requests():
+    flush = RecordingFlush(delay=0.005)
+    group_commit = GroupCommit(flush=flush, max_batch=3, max_delay=0.001)
+
+    results = submit_all(group_commit, list(range(20)))
+
+    assert results == [item * 2 for item in range(20)]
+    assert all(len(batch) <= 3 for batch in flush.batches)
+    assert sorted(item for batch in flush.batches for item in batch) == list(range(20))
+    assert not group_commit.pending
+    assert not group_commit.flushing
+
+
+def test_flush_error_is_raised_in_every_request():
+    flush = RecordingFlush(delay=0.01, error=RuntimeError('database unavailable'))
+    group_commit = GroupCommit(flush=flush, max_delay=0.01)
+
+    results = submit_all(group_commit, list(range(5)))
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    # The group commit recovers once the database does
+    flush.error = None
+    assert group_commit.submit(7) == 14
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from extensions import db
+
+from models.user import User, Friendship
+
+
+HOT_QUERIES = [
+    'User.get_by_id',
+    'User.get_by_username',
+    'User.get_by_email',
+    'User.get_by_username_or_email',
+    'User.activate_by_emails',
+    'User.count_by_avatar_image',
+    'User.get_all_by_ids',
+    'User.get_by_ids_or_usernames',
+    'User.get_all (created_at asc)',
+    'User.get_all (created_at desc)',
+    'User.get_all (updated_at asc)',
+    'User.get_all (updated_at desc)',
+    'User.get_all_friends',
+    'Friendship.get',
+    'Friendship.get_changes',
+    'Friendship.remove_all'
+]
+
+# Not listed on purpose: Friendship.get_all_edges and User.get_avatar_images read every row
+# (to build the friend graph and to sweep avatars), a sequential scan is the right plan for them,
+# and Friendship.get_sync_token does not read any table
+
+
+def get_hot_query(name: str, user: User):
+    if name.startswith('User.get_all ('):
+        sort, order = name[len('User.get_all ('):-1].split()
+        return User.get_all_query(q='', sort=sort, order=order).limit(10)
+
+    return {
+        'User.get_by_id': lambda: User.get_by_id_query(user.id),
+        'User.get_by_username': lambda: User.get_by_username_query(user.username),
+        'User.get_by_email': lambda: User.get_by_email_query(user.email),
+        'User.get_by_username_or_email': lambda: User.get_by_username_or_email_query(user.username, user.email),
+        'User.activate_by_emails': lambda: User.activate_by_emails_statement({user.email}),
+        'User.count_by_avatar_image': lambda: User.count_by_avatar_image_query('avatar.jpg'),
+        'User.get_all_by_ids': lambda: User.get_all_by_ids_query([1, 2, 3]),
+        'User.get_by_ids_or_usernames': lambda: User.get_by_ids_or_usernames_query([1, 2], [user.username]),
+        'User.get_all_friends': lambda: user.get_all_friends_query(q='', sort='created_at', order='desc').limit(20),
+        'Friendship.get': lambda: Friendship.get_query(1, 2),
+        'Friendship.get_changes': lambda: Friendship.get_changes_query(user_id=1, since=datetime(2020, 1, 1)),
+        # remove_all runs an UPDATE with the WHERE clause of this query
+        'Friendship.remove_all': lambda: Friendship.get_all_by_user_query(user.id)
+    }[name]()
+
+
+def explain(query) -> list:
+    # Queries expose their statement, UPDATE statements are explained as is (EXPLAIN does not run them)
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=db.engine.dialect)
+    rows = db.session.connection().execute('EXPLAIN {}'.format(compiled), compiled.params)
+    return [row[0] for row in rows]
+
+
+@pytest.fixture
+def user(app):
+    # The friends relationship needs a user attached to the session, it is never loaded nor flushed
+    user = User(id=1, username='dummy', email='dummy@dummy.com')
+    make_transient_to_detached(user)
+    db.session.add(user)
+
+    # Test tables are small, forbid sequential scans so that one only shows up when no index can serve the query
+    db.session.execute('SET LOCAL enable_seqscan = off')
+
+    yield user
+
+    db.session.rollback()
+    db.session.expunge(user)
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_uses_an_index(user, name):
+    plan = explain(get_hot_query(name, user))
+
+    assert not any('Seq Scan' in line for line in plan), '\n'.join(plan)
@@ -0,0 +1,92 @@
+import time
+import hashlib
+import threading
+
+from collections import OrderedDict
+from functools import wraps
+
+from flask_jwt_extended.config import config
+
+
+class ClaimsCache:
+
+    def __init__(self, maxsize: int=10000):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.claims = OrderedDict()
+        self.keys_by_jti = {}
+
+    @staticmethod
+    def get_key(encoded_token: str) -> str:
+        # The decode key is part of the digest so a token is never trusted by an app with another secret
+        digest = hashlib.sha256(str(config.decode_key).encode())
+        digest.update(encoded_token.encode())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            claims = self.claims.get(key)
+
+            if claims is None:
+                return None
+
+            if 'exp' in claims and claims['exp'] <= time.time():
+                self._pop(key)
+                return None
+
+            self.claims.move_to_end(key)
+            return claims
+
+    def set(self, key: str, claims: dict) -> None:
+        if self.maxsize <= 0:
+            return
+
+        with self.lock:
+            self.claims[key] = claims
+            self.claims.move_to_end(key)
+
+            if 'jti' in claims:
+                self.keys_by_jti[claims['jti']] = key
+
+            while len(self.claims) > self.maxsize:
+                self._pop(next(iter(self.claims)))
+
+    def revoke(self, jti: str) -> None:
+        with self.lock:
+            key = self.keys_by_jti.get(jti)
+
+            if key is not None:
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.claims.clear()
+            self.keys_by_jti.clear()
+
+    def _pop(self, key: str) -> None:
+        claims = self.claims.pop(key, None)
+
+        if claims and 'jti' in claims:
+            self.keys_by_jti.pop(claims['jti'], None)
+
+    def wrap(self, decode_token):
+        if getattr(decode_token, 'claims_cache', None) is self:
+            return decode_token
+
+        @wraps(decode_token)
+        def cached_decode_token(encoded_token, csrf_value=None, allow_expired=False):
+            if csrf_value is not None or allow_expired or self.maxsize <= 0:
+                return decode_token(encoded_token, csrf_value, allow_expired)
+
+            key = self.get_key(encoded_token)
+            claims = self.get(key)
+
+            if claims is None:
+                claims = decode_token(encoded_token)
+                self.set(key, claims)
+
+            return claims
+
+        cached_decode_token.claims_cache = self
+
+        return cached_decode_token
@@ -0,0 +1,261 @@
+import time
+import pickle
+import sqlite3
+import threading
+
+from collections import OrderedDict
+
+from flask_caching.backends.base import BaseCache
+from flask_caching.backends.rediscache import RedisCache
+
+
+class LocalCache:
+
+    def __init__(self, maxsize: int, timeout: int):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            expires, value = entry
+
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, timeout: int=None) -> None:
+        if self.maxsize <= 0:
+            return
+
+        timeout = min(self.timeout, timeout) if timeout else self.timeout
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteCache(BaseCache):
+
+    PRUNE_INTERVAL = 1000
+
+    def __init__(self, path: str, default_timeout: int=300, key_prefix: str=''):
+        super().__init__(default_timeout)
+        self.path = str(path)
+        self.key_prefix = key_prefix or ''
+        self.local = threading.local()
+        self.writes = 0
+
+        self._connection().execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = connection
+
+        return connection
+
+    def _expires(self, timeout: int) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return 0 if timeout == 0 else time.time() + timeout
+
+    def _prune(self) -> None:
+        self.writes += 1
+
+        if self.writes % self.PRUNE_INTERVAL == 0:
+            self._connection().execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (time.time(),))
+
+    def get(self, key: str):
+        row = self._connection().execute('SELECT value FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+                                          (self.key_prefix + key, time.time())).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key: str, value, timeout: int=None) -> bool:
+        self._connection().execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                   (self.key_prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout)))
+        self._prune()
+        return True
+
+    def get_many(self, *keys) -> list:
+        if not keys:
+            return []
+
+        rows = self._connection().execute('SELECT key, value FROM cache WHERE key IN ({}) AND (expires = 0 OR expires > ?)'.format(', '.join('?' * len(keys))),
+                                          [self.key_prefix + key for key in keys] + [time.time()]).fetchall()
+        values = {key[len(self.key_prefix):]: pickle.loads(value) for key, value in rows}
+
+        return [values.get(key) for key in keys]
+
+    def set_many(self, mapping: dict, timeout: int=None) -> bool:
+        connection = self._connection()
+        expires = self._expires(timeout)
+
+        connection.execute('BEGIN IMMEDIATE')
+
+        try:
+            connection.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                   [(self.key_prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires) for key, value in mapping.items()])
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        self._prune()
+        return True
+
+    def add(self, key: str, value, timeout: int=None) -> bool:
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE key = ? AND expires != 0 AND expires <= ?', (self.key_prefix + key, time.time()))
+        cursor = connection.execute('INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                    (self.key_prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout)))
+        return cursor.rowcount == 1
+
+    def delete(self, key: str) -> bool:
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (self.key_prefix + key,))
+        return True
+
+    def delete_many(self, *keys) -> bool:
+        if keys:
+            self._connection().execute('DELETE FROM cache WHERE key IN ({})'.format(', '.join('?' * len(keys))),
+                                       [self.key_prefix + key for key in keys])
+        return True
+
+    def inc(self, key: str, delta: int=1) -> int:
+        connection = self._connection()
+        # Takes the write lock up front so that concurrent increments are serialized
+        connection.execute('BEGIN IMMEDIATE')
+
+        try:
+            value = (self.get(key) or 0) + delta
+            connection.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, 0)',
+                               (self.key_prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        return value
+
+    def has(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def clear(self) -> bool:
+        self._connection().execute('DELETE FROM cache WHERE substr(key, 1, ?) = ?', (len(self.key_prefix), self.key_prefix))
+        return True
+
+
+class TwoTierCache(BaseCache):
+
+    def __init__(self, shared: BaseCache, local_size: int, local_timeout: int, default_timeout: int=300):
+        super().__init__(default_timeout)
+        self.shared = shared
+        self.local = LocalCache(maxsize=local_size, timeout=local_timeout)
+
+    def get(self, key: str):
+        # Local entries only live a few seconds, which bounds how long a worker misses another one's invalidation
+        value = self.local.get(key)
+
+        if value is None:
+            value = self.shared.get(key)
+
+            if value is not None:
+                self.local.set(key, value)
+
+        return value
+
+    def get_many(self, *keys) -> list:
+        values = {key: self.local.get(key) for key in keys}
+        missing = [key for key, value in values.items() if value is None]
+
+        # A single round trip (MGET in Redis) for everything the local tier does not have
+        if missing:
+            for key, value in zip(missing, self.shared.get_many(*missing)):
+                if value is not None:
+                    self.local.set(key, value)
+                    values[key] = value
+
+        return [values[key] for key in keys]
+
+    def set(self, key: str, value, timeout: int=None) -> bool:
+        timeout = self._normalize_timeout(timeout)
+        self.local.set(key, value, timeout=timeout)
+        return self.shared.set(key, value, timeout=timeout)
+
+    def set_many(self, mapping: dict, timeout: int=None):
+        timeout = self._normalize_timeout(timeout)
+
+        for key, value in mapping.items():
+            self.local.set(key, value, timeout=timeout)
+
+        return self.shared.set_many(mapping, timeout=timeout)
+
+    def add(self, key: str, value, timeout: int=None) -> bool:
+        # Used as a lock between workers, so it has to be atomic on the shared tier
+        return self.shared.add(key, value, timeout=self._normalize_timeout(timeout))
+
+    def delete(self, key: str) -> bool:
+        self.local.delete(key)
+        return self.shared.delete(key)
+
+    def delete_many(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+
+        return self.shared.delete_many(*keys)
+
+    def has(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def inc(self, key: str, delta: int=1) -> int:
+        self.local.delete(key)
+        return self.shared.inc(key, delta=delta)
+
+    def clear(self) -> bool:
+        self.local.clear()
+        return self.shared.clear()
+
+
+def two_tier(app, config, args, kwargs) -> TwoTierCache:
+    default_timeout = kwargs.get('default_timeout', 300)
+
+    if config.get('CACHE_SHARED_BACKEND') == 'redis':
+        try:
+            from redis import from_url as redis_from_url
+        except ImportError:
+            raise RuntimeError('no redis module found')
+
+        shared = RedisCache(host=redis_from_url(config.get('CACHE_REDIS_URL')),
+                            default_timeout=default_timeout,
+                            key_prefix=config.get('CACHE_KEY_PREFIX'))
+    else:
+        shared = SQLiteCache(path=config.get('CACHE_SQLITE_PATH'),
+                             default_timeout=default_timeout,
+                             key_prefix=config.get('CACHE_KEY_PREFIX'))
+
+    return TwoTierCache(shared=shared,
+                        local_size=config.get('CACHE_LOCAL_SIZE'),
+                        local_timeout=config.get('CACHE_LOCAL_TIMEOUT'),
+                        default_timeout=default_timeout)
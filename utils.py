@@ -1,13 +1,18 @@
 import os
 import sys
 
+import time
 import uuid
+import hashlib
+
+from functools import lru_cache, wraps
 
 from passlib.hash import pbkdf2_sha256
 
 from itsdangerous import URLSafeTimedSerializer
 
-from flask import current_app
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
 from flask_uploads import extension
 
 from PIL import Image
@@ -26,12 +31,16 @@ def hash_password(password: str) -> str:
 def check_password(password: str, hashed: str) -> bool:
     return pbkdf2_sha256.verify(password, hashed)
 
-def generate_token(email: str, salt: str=None) -> URLSafeTimedSerializer:
-    serializer = URLSafeTimedSerializer(current_app.config.get('SECRET_KEY'))
+@lru_cache(maxsize=8)
+def get_serializer(secret_key: str) -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(secret_key)
+
+def generate_token(email: str, salt: str=None) -> str:
+    serializer = get_serializer(current_app.config.get('SECRET_KEY'))
     return serializer.dumps(email, salt=salt)
 
 def verify_token(token: str, max_age: int=180, salt: str=None) -> str:
-    serializer = URLSafeTimedSerializer(current_app.config.get('SECRET_KEY'))
+    serializer = get_serializer(current_app.config.get('SECRET_KEY'))
 
     try:
         email = serializer.loads(token, max_age=max_age, salt=salt)
@@ -41,14 +50,30 @@ def verify_token(token: str, max_age: int=180, salt: str=None) -> str:
     return email
 
 def save_image(image, folder: str) -> str:
+    digest = hashlib.sha256()
+
+    for chunk in iter(lambda: image.stream.read(64 * 1024), b''):
+        digest.update(chunk)
+
+    image.stream.seek(0)
+
+    compressed_filename = '{}.jpg'.format(digest.hexdigest())
+
+    # Refresh the modification time of an existing file so that the sweeper leaves it alone
+    try:
+        os.utime(image_set.path(filename=compressed_filename, folder=folder))
+        return compressed_filename
+    except FileNotFoundError:
+        pass
+
     filename = '{}.{}'.format(uuid.uuid4(), extension(image.filename))
     image_set.save(image, folder=folder, name=filename)
 
-    filename = compress_image(filename=filename, folder=folder)
+    filename = compress_image(filename=filename, folder=folder, compressed_filename=compressed_filename)
 
     return filename
 
-def compress_image(filename: str, folder: str) -> str:
+def compress_image(filename: str, folder: str, compressed_filename: str) -> str:
     file_path = image_set.path(filename=filename, folder=folder)
 
     image = Image.open(file_path)
@@ -60,18 +85,81 @@ def compress_image(filename: str, folder: str) -> str:
         maxsize = (1600, 1600)
         image.thumbnail(maxsize)
 
-    compressed_filename = '{}.jpg'.format(uuid.uuid4())
     compressed_file_path = image_set.path(filename=compressed_filename, folder=folder)
+    tmp_file_path = '{}.{}.tmp'.format(compressed_file_path, uuid.uuid4())
 
-    image.save(compressed_file_path, optimize=True, quality=85)
+    image.save(tmp_file_path, format='JPEG', optimize=True, quality=85)
 
+    os.replace(tmp_file_path, compressed_file_path)
     os.remove(file_path)
 
     return compressed_filename
 
-def clear_cache(key_prefix: str) -> None:
-    keys = [key for key in cache.cache._cache.keys() if key.startswith(key_prefix)]
-    cache.delete_many(*keys)
+def cache_response(timeout: int, per_user: bool=False, unless=None, namespace: str=None):
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if unless is not None and unless():
+                return f(*args, **kwargs)
+
+            args_as_sorted_tuple = tuple(sorted(request.args.items(multi=True)))
+            key = request.path + hashlib.md5(str(args_as_sorted_tuple).encode()).hexdigest()
+
+            if per_user:
+                key = '{}.{}'.format(key, get_jwt_identity())
+
+            # Entries of a namespace are invalidated all at once by bumping its generation
+            if namespace is not None:
+                key = '{}.{}{}'.format(key, namespace, cache.get(cache_generation_key(namespace)) or 0)
+
+            entry = cache.get(key)
+
+            if entry is not None and entry[1] > time.time():
+                return entry[0]
+
+            # Only one request recomputes an expired entry, the others get the stale one
+            # or, if there is none, wait for it to be computed
+            lock_key = '{}.lock'.format(key)
+            lock_timeout = current_app.config.get('CACHE_LOCK_TIMEOUT')
+            locked = cache.add(lock_key, True, timeout=lock_timeout)
+
+            if not locked:
+                if entry is not None:
+                    return entry[0]
+
+                deadline = time.time() + lock_timeout
+
+                while time.time() < deadline:
+                    time.sleep(0.05)
+                    entry = cache.get(key)
+
+                    if entry is not None:
+                        return entry[0]
+
+            try:
+                rv = f(*args, **kwargs)
+                cache.set(key, (rv, time.time() + timeout), timeout=timeout + current_app.config.get('CACHE_STALE_TIMEOUT'))
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+
+            return rv
+        return decorated
+    return decorator
+
+def cache_generation_key(namespace: str) -> str:
+    return 'generation_{}'.format(namespace)
+
+def clear_cache(namespace: str) -> None:
+    cache.cache.inc(cache_generation_key(namespace))
+
+def user_cache_key(id: int=None, username: str=None) -> str:
+    if id is not None:
+        return 'user_public_id_{}'.format(id)
+    return 'user_public_username_{}'.format(username)
+
+def clear_user_cache(id: int, username: str) -> None:
+    cache.delete_many(user_cache_key(id=id), user_cache_key(username=username))
 
 def get_console_handler() -> logging.Handler:
     console_handler = logging.StreamHandler(sys.stdout)